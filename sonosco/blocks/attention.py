@@ -3,8 +3,6 @@ import torch.nn as nn
 import torch.nn.functional as F
 import numpy as np
 
-from sonosco.common.global_settings import CUDA_ENABLED
-
 SOFT_WINDOW_SIGMA = 4.0
 
 
@@ -40,13 +38,12 @@ class DotAttention(nn.Module):
         keys = keys.permute(0, 2, 1)  # [B,T_enc,K] -> [B,K,T_enc]
         scores = torch.bmm(queries, keys)  # [B,T_dec,Q]*[B,K,T_enc] = [B,T_dec,T_enc]
 
-        xv, yv = torch.meshgrid([torch.arange(0, scores.shape[1]), torch.arange(0, scores.shape[2])])
+        xv, yv = torch.meshgrid([torch.arange(0, scores.shape[1], device=scores.device),
+                                 torch.arange(0, scores.shape[2], device=scores.device)])
         xv, yv = xv.type(torch.float32), yv.type(torch.float32)
 
         if soft_window_enabled:
             soft_window = (1. / (2. * SOFT_WINDOW_SIGMA ** 2)) * (xv - (scores.shape[1] / scores.shape[2] * yv))
-            if CUDA_ENABLED:
-                soft_window = soft_window.cuda()
             scores = self.softmax(scores.mul_(self.scale) - soft_window)
         else:
             scores = self.softmax(scores.mul_(self.scale))
@@ -24,6 +24,7 @@ class SequenceWise(nn.Module):
         """
         super(SequenceWise, self).__init__()
         self.module = module
+        self._is_batch_norm = isinstance(module, nn.BatchNorm1d)
 
     def forward(self, x: torch.Tensor) -> torch.Tensor:
         """
@@ -33,8 +34,15 @@ class SequenceWise(nn.Module):
 
         """
         t, n = x.size(0), x.size(1)
-        x = x.view(t * n, -1)
-        x = self.module(x)
+        # reshape instead of view: inputs coming out of an RNN or a transpose
+        # upstream are often non-contiguous and view would raise
+        x = x.reshape(t * n, x.size(-1))
+        if self._is_batch_norm and not self.training and self.module.track_running_stats:
+            # skip the module dispatch and normalize against the buffered stats
+            x = functional.batch_norm(x, self.module.running_mean, self.module.running_var,
+                                      self.module.weight, self.module.bias, False, 0.0, self.module.eps)
+        else:
+            x = self.module(x)
         x = x.view(t, n, -1)
         return x
 
@@ -67,17 +75,22 @@ class MaskConv(nn.Module):
         Returns: Masked output from the module
 
         """
+        lengths_tensor = torch.as_tensor(lengths, device=x.device, dtype=torch.long)
 
+        mask = None
+        mask_time = -1
         for module in self.seq_module:
             x = module(x)
-            mask = torch.ByteTensor(x.size()).fill_(0)
-            if x.is_cuda:
-                mask = mask.cuda()
-            for i, length in enumerate(lengths):
-                length = length.item()
-                if (mask[i].size(2) - length) > 0:
-                    mask[i].narrow(2, length, mask[i].size(2) - length).fill_(1)
-            x = x.masked_fill(mask, 0)
+            if x.size(3) != mask_time:
+                # Broadcasted comparison over the time axis, bool of [B, T];
+                # rebuilt only when a strided conv changes the time dim
+                mask_time = x.size(3)
+                time_indices = torch.arange(mask_time, device=x.device)
+                mask = time_indices.unsqueeze(0) >= lengths_tensor.unsqueeze(1)
+            # out-of-place: inplace activations in the conv stack save their
+            # result for backward, and mutating it trips autograd's version
+            # counter
+            x = x.masked_fill(mask[:, None, None, :], 0)
         return x, lengths
 
 
@@ -102,14 +115,21 @@ class BatchRNN(nn.Module):
                  hidden_size: int,
                  rnn_type: nn.Module = nn.LSTM,
                  batch_norm: bool = True,
-                 bidirectional: bool = False):
+                 bidirectional: bool = False,
+                 batch_first: bool = False,
+                 enforce_sorted: bool = False):
         super(BatchRNN, self).__init__()
         self.bidirectional = bidirectional
         self.input_size = input_size
         self.hidden_size = hidden_size
+        self.batch_first = batch_first
+        # callers that feed batches pre-sorted by length (descending) can set
+        # enforce_sorted to skip pack_padded_sequence's internal sort + gathers
+        self.enforce_sorted = enforce_sorted
         self.batch_norm = SequenceWise(nn.BatchNorm1d(input_size)) if batch_norm else None
         self.rnn = rnn_type(input_size=input_size, hidden_size=hidden_size,
-                            bidirectional=bidirectional, bias=False)
+                            bidirectional=bidirectional, bias=False,
+                            batch_first=batch_first)
 
     def flatten_parameters(self) -> None:
         """
@@ -132,9 +152,10 @@ class BatchRNN(nn.Module):
         """
         if self.batch_norm is not None:
             x = self.batch_norm(x)
-        x = nn.utils.rnn.pack_padded_sequence(x, output_lengths, enforce_sorted=False)
+        x = nn.utils.rnn.pack_padded_sequence(x, output_lengths, batch_first=self.batch_first,
+                                              enforce_sorted=self.enforce_sorted)
         x, h = self.rnn(x, *args)
-        x, _ = nn.utils.rnn.pad_packed_sequence(x)
+        x, _ = nn.utils.rnn.pad_packed_sequence(x, batch_first=self.batch_first)
         if self.bidirectional:
             x = x.view(x.size(0), x.size(1), 2, -1).sum(2).view(x.size(0), x.size(1), -1)  # (TxNxH*2) -> (TxNxH) by sum
         return x
@@ -176,25 +197,28 @@ class TDSBlock(nn.Module):
                                 kernel_size=(kernel_size, 1),
                                 stride=(1, 1),
                                 padding=(kernel_size // 2, 0))
+        self.relu1 = nn.ReLU(inplace=True)
         self.dropout1 = nn.Dropout(p=dropout)
         self.layer_norm1 = nn.LayerNorm(in_freq * channel, eps=1e-6)
 
         # second block
-        self.conv1d_1 = nn.Conv2d(in_channels=in_freq * channel,
-                                  out_channels=in_freq * channel,
-                                  kernel_size=1,
-                                  stride=1,
-                                  padding=0)
+        # 1x1 convs over `[B, C*F, T, 1]` are plain matmuls on the flattened
+        # dim, so keep the parameters in nn.Linear and dispatch a single GEMM
+        self.lin1 = nn.Linear(in_freq * channel, in_freq * channel)
+        self.relu2 = nn.ReLU(inplace=True)
         self.dropout2_1 = nn.Dropout(p=dropout)
 
-        self.conv1d_2 = nn.Conv2d(in_channels=in_freq * channel,
-                                  out_channels=in_freq * channel,
-                                  kernel_size=1,
-                                  stride=1,
-                                  padding=0)
+        self.lin2 = nn.Linear(in_freq * channel, in_freq * channel)
         self.dropout2_2 = nn.Dropout(p=dropout)
         self.layer_norm2 = nn.LayerNorm(in_freq * channel, eps=1e-6)
 
+    def fuse(self) -> None:
+        """
+        Fuses conv + relu into a single module for inference.
+        Only valid in eval mode.
+        """
+        torch.ao.quantization.fuse_modules(self, [['conv2d', 'relu1']], inplace=True)
+
     def forward(self, xs: torch.Tensor) -> torch.Tensor:
         """Forward computation.
         Args:
@@ -207,33 +231,31 @@ class TDSBlock(nn.Module):
         # first block
         residual = xs
         xs = self.conv2d(xs)
-        xs = torch.relu(xs)
-        if self.dropout_prob != 0:
+        xs = self.relu1(xs)
+        if self.training and self.dropout_prob != 0:
             xs = self.dropout1(xs)
 
         xs = xs + residual  # `[B, out_ch, T, feat_dim]`
 
         # layer normalization
         bs, out_ch, time, feat_dim = xs.size()
-        xs = xs.transpose(2, 1).contiguous().view(bs, time, -1)  # `[B, T, out_ch * feat_dim]`
+        xs = xs.permute(0, 2, 1, 3).reshape(bs, time, out_ch * feat_dim)  # `[B, T, out_ch * feat_dim]`
         xs = self.layer_norm1(xs)
-        xs = xs.contiguous().transpose(2, 1).unsqueeze(3)  # `[B, out_ch * feat_dim, T, 1]`
 
         # second block
         residual = xs
-        xs = self.conv1d_1(xs)
-        xs = torch.relu(xs)
-        if self.dropout_prob != 0:
+        xs = self.lin1(xs)
+        xs = self.relu2(xs)
+        if self.training and self.dropout_prob != 0:
             xs = self.dropout2_1(xs)
-        xs = self.conv1d_2(xs)
-        if self.dropout_prob != 0:
+        xs = self.lin2(xs)
+        if self.training and self.dropout_prob != 0:
             xs = self.dropout2_2(xs)
-        xs = xs + residual  # `[B, out_ch * feat_dim, T, 1]`
+        xs = xs + residual  # `[B, T, out_ch * feat_dim]`
 
         # layer normalization
-        xs = xs.transpose(2, 1).contiguous().view(bs, time, -1)  # `[B, T, out_ch * feat_dim]`
         xs = self.layer_norm2(xs)
-        xs = xs.view(bs, time, out_ch, feat_dim).contiguous().transpose(2, 1)
+        xs = xs.view(bs, time, out_ch, feat_dim).permute(0, 2, 1, 3)
 
         return xs
 
@@ -255,9 +277,17 @@ class SubsampleBlock(nn.Module):
                                 kernel_size=(2, 1),
                                 stride=(2, 1),
                                 padding=(0, 0))
+        self.relu = nn.ReLU(inplace=True)
         self.dropout = nn.Dropout(p=dropout)
         self.layer_norm = nn.LayerNorm(in_freq * out_channel, eps=1e-6)
 
+    def fuse(self) -> None:
+        """
+        Fuses conv + relu into a single module for inference.
+        Only valid in eval mode.
+        """
+        torch.ao.quantization.fuse_modules(self, [['conv1d', 'relu']], inplace=True)
+
     def forward(self, xs: torch.Tensor) -> torch.Tensor:
         """Forward computation.
         Args:
@@ -268,8 +298,8 @@ class SubsampleBlock(nn.Module):
         bs, _, time, _ = xs.size()
 
         xs = self.conv1d(xs)
-        xs = torch.relu(xs)
-        if self.dropout_prob != 0:
+        xs = self.relu(xs)
+        if self.training and self.dropout_prob != 0:
             xs = self.dropout(xs)
 
         # layer normalization